@@ -1,42 +1,213 @@
 import os
+import io
+import hmac
 import random
 import math
+import functools
+import time
 from datetime import datetime, date
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import joinedload
+from flask_caching import Cache
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import case, event, func, inspect, or_, select, text, update, insert, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InvalidRequestError, OperationalError
+from sqlalchemy.orm import joinedload, selectinload, raiseload, aliased
+from sqlalchemy.schema import CreateIndex
 from dotenv import load_dotenv
+import orjson
+import redis
+from redis.exceptions import RedisError
 
 # Load environment variables (like DATABASE_URL) from a .env file locally
 load_dotenv() 
 
 # --- Application Setup ---
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, keeping Flask's key sorting and date format."""
+
+    def dumps(self, obj, **kwargs):
+        # Dates go through self.default, as with stdlib json; non-str keys are
+        # stringified as json.dumps does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode('utf-8')
+        except TypeError:
+            # Anything orjson rejects (e.g. ints beyond 64 bits) goes through Flask's own encoder
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Debug mode (reloader, interactive debugger, template reloading) is for local
+# development only; production runs under gunicorn via wsgi.py.
+DEBUG = os.environ.get('FLASK_ENV') == 'development'
+app.config['TEMPLATES_AUTO_RELOAD'] = DEBUG
 
 # Configuration for SQLAlchemy (PostgreSQL/MySQL)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///pong_league.db')
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///pong_league.db')
+_db_url = make_url(DATABASE_URL)
+if _db_url.drivername == 'postgresql':
+    # Newer SQLAlchemy maps a bare postgresql:// to psycopg 3; pin the psycopg2
+    # driver that requirements.txt installs and the tuning below and psycogreen
+    # (wsgi.py) are written for.
+    _db_url = _db_url.set(drivername='postgresql+psycopg2')
+app.config['SQLALCHEMY_DATABASE_URI'] = _db_url.render_as_string(hide_password=False)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+if _db_url.get_backend_name() != 'sqlite':
+    # Keep a warm pool of server connections so requests reuse them instead of
+    # reconnecting; pre_ping/recycle drop connections the server has closed.
+    # Sized for gevent workers, where one process serves many requests at once.
+    engine_options = {
+        'pool_size': 20,
+        'max_overflow': 30,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+    if _db_url.get_driver_name() == 'psycopg2':
+        # Send bulk INSERTs as multi-VALUES statements and other executemany
+        # calls through psycopg2's execute_batch, in pages.
+        engine_options.update({
+            'executemany_mode': 'values_plus_batch',
+            'insertmanyvalues_page_size': 1000,
+            'executemany_batch_page_size': 500,
+        })
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
 db = SQLAlchemy(app)
 
+# Cache for rendered pages, shared by all workers through Redis. Without
+# REDIS_URL nothing is cached (every request reads the database), except under
+# the single-process development server, which caches in memory. A per-process
+# cache under several workers would keep serving pages another worker's write
+# has made stale.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_TIMEOUT = 300 # Seconds
+if REDIS_URL:
+    CACHE_TYPE = 'RedisCache'
+elif DEBUG:
+    CACHE_TYPE = 'SimpleCache'
+else:
+    CACHE_TYPE = 'NullCache'
+cache = Cache(app, config={
+    'CACHE_TYPE': CACHE_TYPE,
+    'CACHE_REDIS_URL': REDIS_URL,
+    'CACHE_DEFAULT_TIMEOUT': CACHE_TIMEOUT,
+    'CACHE_NO_NULL_WARNING': True,
+})
+
+# Direct Redis access for structures the cache API can't express (the recent
+# matches list). None without REDIS_URL, in which case callers fall back to SQL.
+redis_client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+# Compiled templates are kept on disk so each new worker skips Jinja's
+# lex/parse/compile step for templates another process already compiled.
+# Without JINJA_CACHE_DIR, Jinja uses its own per-user, owner-checked 0700
+# directory; the cached bytecode is executed, so it must not be writable by others.
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR')
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+LEAGUE_VERSION_KEY = 'league_version'
+LEADERBOARD_CACHE_KEY = 'leaderboard'
+RECENT_MATCHES_KEY = 'recent_matches'
+RECENT_MATCHES_LIMIT = 10
+
+# The cache fails open: if Redis is unreachable, reads fall back to the database
+# and post-commit cache updates are skipped, so a write that committed is never
+# reported as failed.
+def _cache_unavailable(action):
+    app.logger.warning("Cache unavailable while %s; falling back to the database", action, exc_info=True)
+
+def league_version():
+    """
+    Returns the current league data version. Cache entries derived from league
+    or tournament data embed it in their key, so a new version orphans them all.
+    None when caching is disabled (NullCache) or the cache is unreachable.
+    """
+    try:
+        version = cache.get(LEAGUE_VERSION_KEY)
+        if version is None:
+            # Start from a fresh token (never 0) so entries cached under a version
+            # that was evicted can't be picked up again.
+            cache.add(LEAGUE_VERSION_KEY, time.time_ns(), timeout=0)
+            version = cache.get(LEAGUE_VERSION_KEY)
+    except RedisError:
+        _cache_unavailable("reading the league version")
+        return None
+    return version
+
+def bump_league_version():
+    """Moves to a new league version after a write, invalidating version-keyed entries."""
+    try:
+        cache.set(LEAGUE_VERSION_KEY, time.time_ns(), timeout=0)
+    except RedisError:
+        _cache_unavailable("bumping the league version")
+
+def index_cache_key():
+    return f"index:{league_version()}"
+
 # --- SECURITY CONFIGURATION ---
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'secret')
+_ADMIN_PASSWORD_BYTES = ADMIN_PASSWORD.encode('utf-8')
 
 def check_admin_password(submitted_password):
-    """Checks the submitted password against the environment secret."""
-    return submitted_password == ADMIN_PASSWORD
+    """Checks the submitted password against the environment secret in constant time."""
+    if not isinstance(submitted_password, str):
+        return False
+    return hmac.compare_digest(_ADMIN_PASSWORD_BYTES, submitted_password.encode('utf-8'))
+# Every admin-only POST route; checked once in _require_admin_password below
+ADMIN_ENDPOINTS = frozenset({
+    'remove_player',
+    'remove_match',
+    'update_admin_note',
+    'admin_start_signup',
+    'admin_start_tournament',
+    'admin_end_tournament',
+    'admin_start_next_round',
+    'admin_recompute_elos',
+})
+
+@app.before_request
+def _require_admin_password():
+    """Rejects requests to admin endpoints that don't carry the admin password."""
+    if request.endpoint in ADMIN_ENDPOINTS and not check_admin_password(request.form.get('admin_password')):
+        return "Unauthorized: Incorrect admin password.", 401
 # --- END SECURITY CONFIGURATION ---
 
 
 # --- Database Models ---
 
+STARTING_ELO = 1200
+
 class Player(db.Model):
     __tablename__ = 'players'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Text, nullable=False)
-    elo = db.Column(db.Integer, default=1200)
+    elo = db.Column(db.Integer, default=STARTING_ELO)
     wins = db.Column(db.Integer, default=0)
     losses = db.Column(db.Integer, default=0)
+    # Maintained by the database; splits the leaderboard into ranked/unranked
+    matches_played = db.Column(db.Integer, db.Computed('wins + losses', persisted=True))
+
+    # Leaderboard is read in Elo order on every page render, split on matches_played
+    __table_args__ = (
+        db.Index('ix_players_elo_desc', elo.desc()),
+        db.Index('ix_players_mp_elo', matches_played, elo.desc()),
+    )
     
 class Match(db.Model):
     __tablename__ = 'matches'
@@ -50,8 +221,16 @@ class Match(db.Model):
     winner_post_elo = db.Column(db.Integer)
     loser_post_elo = db.Column(db.Integer)
 
-    winner = db.relationship("Player", foreign_keys=[winner_id], backref="won_matches")
-    loser = db.relationship("Player", foreign_keys=[loser_id], backref="lost_matches")
+    __table_args__ = (
+        db.Index('ix_matches_date_desc', date.desc()), # Recent matches panel
+        db.Index('ix_matches_winner_id', winner_id),   # Match purge in remove_player
+        db.Index('ix_matches_loser_id', loser_id),
+    )
+
+    # Eager-load both players with one batched IN query on every Match load.
+    # The backrefs stay lazy so the leaderboard doesn't pull in match history.
+    winner = db.relationship("Player", foreign_keys=[winner_id], backref="won_matches", lazy='selectin')
+    loser = db.relationship("Player", foreign_keys=[loser_id], backref="lost_matches", lazy='selectin')
 
 class LeagueConfig(db.Model):
     __tablename__ = 'league_config'
@@ -89,24 +268,51 @@ class TournamentMatch(db.Model):
     match_date = db.Column(db.Date, default=date.today)
     best_of_games = db.Column(db.Integer, default=3) # 3 for early rounds, 5 for final
 
+    # Bracket listing, MAX(round_num) and the current-round lookup all seek on this
+    __table_args__ = (
+        db.Index('ix_tm_tid_round_match', tournament_id, round_num, match_num),
+    )
+
     player1 = db.relationship("Player", foreign_keys=[player1_id])
     player2 = db.relationship("Player", foreign_keys=[player2_id])
     winner = db.relationship("Player", foreign_keys=[winner_id]) # Added winner relationship
     tournament = db.relationship("Tournament", backref="matches")
 
 
+# --- N+1 Detection ---
+# In debug mode any lazy relationship load during a request raises, whether or
+# not the query that produced the parent object went through guard_lazy_loads().
+# Relationships a route needs should be loaded up front (joinedload/selectinload).
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _raise_on_lazy_load(orm_execute_state):
+    if not (app.debug and has_request_context() and orm_execute_state.is_select):
+        return
+    if orm_execute_state.lazy_loaded_from is not None:
+        raise InvalidRequestError(
+            f"Lazy load of {orm_execute_state.loader_strategy_path[-1]} during "
+            f"{request.endpoint}; load it up front to avoid an N+1 query."
+        )
+
+
 # --- Utility Functions ---
 
+# Next power of two for every bracket size up to 256 players; index 0 stays 0
+_NEXT_POWER_OF_TWO = [0] + [1 << (n - 1).bit_length() for n in range(1, 257)]
+
 def get_next_power_of_two(n):
-    """Returns the smallest power of two greater than or equal to n."""
-    if n <= 0: return 0
-    return 2**(n - 1).bit_length()
+    """Returns the smallest power of two greater than or equal to n (0 for n <= 0)."""
+    if 0 <= n < len(_NEXT_POWER_OF_TWO):
+        return _NEXT_POWER_OF_TWO[n]
+    if n < 0: return 0
+    return 1 << (n - 1).bit_length()
 
 def generate_bracket(players):
     """
     Generates a single-elimination bracket structure.
     Players are randomly shuffled. Byes are handled if player count is not a power of 2.
-    Returns a list of TournamentMatch objects for Round 1.
+    Returns the Round 1 matches as TournamentMatch column dicts (without tournament_id),
+    ready for a bulk insert.
     """
     random.shuffle(players)
     N = len(players)
@@ -125,7 +331,7 @@ def generate_bracket(players):
         
         # Matches for players who get a bye (these automatically advance to Round 2)
         for i, player in enumerate(players_with_byes):
-            match_list.append(TournamentMatch(
+            match_list.append(dict(
                 round_num=1,
                 match_num=i + 1,
                 player1_id=player.id,
@@ -140,11 +346,13 @@ def generate_bracket(players):
         for i in range(num_r1_matches):
             p1 = players_to_play[i * 2]
             p2 = players_to_play[i * 2 + 1]
-            match_list.append(TournamentMatch(
+            match_list.append(dict(
                 round_num=1,
                 match_num=byes + i + 1,
                 player1_id=p1.id,
                 player2_id=p2.id,
+                winner_id=None,
+                score=None,
                 best_of_games=3
             ))
             
@@ -153,45 +361,238 @@ def generate_bracket(players):
         for i in range(N // 2):
             p1 = players[i * 2]
             p2 = players[i * 2 + 1]
-            match_list.append(TournamentMatch(
+            match_list.append(dict(
                 round_num=1,
                 match_num=i + 1,
                 player1_id=p1.id,
                 player2_id=p2.id,
+                winner_id=None,
+                score=None,
                 best_of_games=3
             ))
             
     return match_list
 
 
+ELO_K_FACTOR = 32 # Maximum rating change per match
+# 10 ** (x / 400) == exp(x * ln(10) / 400)
+_ELO_ALPHA = math.log(10) / 400
+
+@functools.lru_cache(maxsize=4096) # Pure function of two ints; replays repeat pairs often
 def calculate_elo(winner_elo, loser_elo):
     """Calculates the new Elo ratings for the winner and loser, rounding results."""
-    K = 32
-    expected_winner = 1 / (1 + 10 ** ((loser_elo - winner_elo) / 400))
-    expected_loser = 1 / (1 + 10 ** ((winner_elo - loser_elo) / 400))
-    new_winner_elo_float = winner_elo + K * (1 - expected_winner)
-    new_loser_elo_float = loser_elo + K * (0 - expected_loser)
-    new_winner_elo = int(round(new_winner_elo_float))
-    new_loser_elo = int(round(new_loser_elo_float))
+    expected_winner = 1.0 / (1.0 + math.exp((loser_elo - winner_elo) * _ELO_ALPHA))
+    # expected_loser == 1 - expected_winner, so both players move by the same amount
+    delta = ELO_K_FACTOR * (1.0 - expected_winner)
+    new_winner_elo = int(round(winner_elo + delta))
+    new_loser_elo = int(round(loser_elo - delta))
     return new_winner_elo, new_loser_elo
 
+def replay_elos():
+    """
+    Recomputes every player's Elo and W-L record, and each match's pre/post Elo,
+    by replaying the whole match history in date order from STARTING_ELO.
+    Reads the history in one SELECT and writes it back with two bulk UPDATEs;
+    the caller commits.
+    """
+    # Lock every player row first: log_match takes FOR UPDATE on its two players,
+    # so a match logged concurrently either commits before the history is read
+    # or waits for this transaction, and its rating can't be overwritten.
+    player_ids = db.session.execute(
+        select(Player.id).order_by(Player.id).with_for_update()
+    ).scalars().all()
+    ratings = dict.fromkeys(player_ids, STARTING_ELO)
+    wins = dict.fromkeys(player_ids, 0)
+    losses = dict.fromkeys(player_ids, 0)
+
+    history = db.session.execute(
+        select(Match.id, Match.winner_id, Match.loser_id).order_by(Match.date, Match.id)
+    ).all()
+
+    match_rows = []
+    for match_id, winner_id, loser_id in history:
+        winner_pre_elo = ratings.get(winner_id, STARTING_ELO)
+        loser_pre_elo = ratings.get(loser_id, STARTING_ELO)
+        winner_post_elo, loser_post_elo = calculate_elo(winner_pre_elo, loser_pre_elo)
+        ratings[winner_id] = winner_post_elo
+        ratings[loser_id] = loser_post_elo
+        wins[winner_id] = wins.get(winner_id, 0) + 1
+        losses[loser_id] = losses.get(loser_id, 0) + 1
+        match_rows.append({
+            'id': match_id,
+            'winner_pre_elo': winner_pre_elo,
+            'loser_pre_elo': loser_pre_elo,
+            'winner_post_elo': winner_post_elo,
+            'loser_post_elo': loser_post_elo,
+        })
+
+    if match_rows:
+        db.session.execute(update(Match), match_rows)
+    if player_ids:
+        db.session.execute(update(Player), [
+            {'id': pid, 'elo': ratings[pid], 'wins': wins[pid], 'losses': losses[pid]}
+            for pid in player_ids
+        ])
+
+def _ranked_players():
+    """
+    Players as dicts (id, name, elo, wins, losses, rank), split into those who
+    have played at least one match and those who haven't, each highest Elo first.
+    Both lists come from one statement, so they share a snapshot.
+    """
+    elo_order = (Player.elo.desc(), Player.id)
+    has_played = Player.matches_played > 0
+    rank = func.row_number().over(partition_by=has_played, order_by=elo_order).label('rank')
+    active, inactive = [], []
+    for row in db.session.execute(
+        select(Player.id, Player.name, Player.elo, Player.wins, Player.losses, rank, has_played.label('has_played'))
+        .order_by(*elo_order)
+    ):
+        player = dict(row._mapping)
+        (active if player.pop('has_played') else inactive).append(player)
+    return active, inactive
+
+def get_leaderboard():
+    """
+    Returns (active, inactive) player lists: those who have played at least one
+    match and those who haven't, each ranked by Elo in the database.
+    Cached per league version, so a write's version bump (after its commit)
+    moves readers to a fresh entry.
+    """
+    version = league_version()
+    if version is None:
+        return _ranked_players()
+    key = f"{LEADERBOARD_CACHE_KEY}:{version}"
+    try:
+        leaderboard = cache.get(key)
+    except RedisError:
+        _cache_unavailable("reading the leaderboard")
+        return _ranked_players()
+    if leaderboard is None:
+        leaderboard = _ranked_players()
+        try:
+            cache.set(key, leaderboard)
+        except RedisError:
+            _cache_unavailable("storing the leaderboard")
+    return leaderboard
+
+# Per-process copy of the LeagueConfig row and the league version it was read at.
+# The version is shared through Redis, so any worker's write moves every copy on.
+_config_cache = {'version': None, 'config': None}
+
+def get_config():
+    """
+    Returns the league config as a dict (admin_note, tournament_state) for read-only use.
+    The row is only re-read when the league version has moved on since this process
+    last loaded it; routes that change it go through db.session and bump the version.
+    Writes must not be guarded on it.
+    """
+    version = league_version()
+    # No version without a cache backend to hold it; then always read the row
+    if version is None or _config_cache['version'] != version:
+        config = db.session.get(LeagueConfig, 1)
+        _config_cache['config'] = {
+            'admin_note': config.admin_note if config else "",
+            'tournament_state': config.tournament_state if config else 0,
+        }
+        _config_cache['version'] = version
+    return _config_cache['config']
+
+def guard_lazy_loads(*options):
+    """
+    Returns the given loader options, plus raiseload('*') in debug mode so any
+    relationship the caller didn't load up front raises instead of quietly
+    issuing one SELECT per row.
+    """
+    if app.debug:
+        return (*options, raiseload('*'))
+    return options
+
+def _recent_match_dict(match_id, score, match_date, winner_pre_elo, winner_post_elo,
+                       loser_pre_elo, loser_post_elo, winner_name, loser_name):
+    """One entry of the recent matches list, in the shape index.html reads."""
+    return {
+        'id': match_id,
+        'score': score,
+        'date': str(match_date), # Rendered as-is into data-utc-date
+        'winner_pre_elo': winner_pre_elo,
+        'winner_post_elo': winner_post_elo,
+        'loser_pre_elo': loser_pre_elo,
+        'loser_post_elo': loser_post_elo,
+        'winner_name': winner_name,
+        'loser_name': loser_name,
+    }
+
+def get_recent_matches():
+    """
+    Returns the latest RECENT_MATCHES_LIMIT matches as dicts, newest first.
+    With Redis they are read from a list cached per league version, so a write's
+    version bump (after its commit) moves readers to a list rebuilt from SQL.
+    """
+    version = league_version() if redis_client is not None else None
+    key = f"{RECENT_MATCHES_KEY}:{version}"
+    if version is not None:
+        try:
+            cached = redis_client.lrange(key, 0, RECENT_MATCHES_LIMIT - 1)
+        except RedisError:
+            _cache_unavailable("reading the recent matches")
+            cached = None
+        if cached:
+            return [orjson.loads(entry) for entry in cached]
+
+    # Only the columns the match history shows; no ORM objects
+    winner_player = aliased(Player)
+    loser_player = aliased(Player)
+    matches = [_recent_match_dict(*row) for row in db.session.execute(
+        select(
+            Match.id, Match.score, Match.date,
+            Match.winner_pre_elo, Match.winner_post_elo,
+            Match.loser_pre_elo, Match.loser_post_elo,
+            winner_player.name, loser_player.name,
+        )
+        .join(winner_player, Match.winner_id == winner_player.id)
+        .join(loser_player, Match.loser_id == loser_player.id)
+        .order_by(Match.date.desc())
+        .limit(RECENT_MATCHES_LIMIT)
+    )]
+
+    if version is not None and matches:
+        # A refill racing another one pushes the same rows; LTRIM keeps one copy.
+        # Lists left behind by older versions expire.
+        try:
+            with redis_client.pipeline() as pipe:
+                pipe.rpush(key, *(orjson.dumps(m) for m in matches))
+                pipe.ltrim(key, 0, RECENT_MATCHES_LIMIT - 1)
+                pipe.expire(key, CACHE_TIMEOUT)
+                pipe.execute()
+        except RedisError:
+            _cache_unavailable("storing the recent matches")
+    return matches
+
 # --- Routes ---
+# The only Player columns index.html reads for signups and bracket entries
+PLAYER_LABEL_COLUMNS = (Player.id, Player.name)
+
+# Bracket listings use selectinload, not joinedload: the same few players
+# appear across many matches, so one IN (...) query per relationship builds
+# each Player once instead of re-reading it on every joined row.
+BRACKET_PLAYER_LOADS = (
+    selectinload(TournamentMatch.player1).load_only(*PLAYER_LABEL_COLUMNS),
+    selectinload(TournamentMatch.player2).load_only(*PLAYER_LABEL_COLUMNS),
+    selectinload(TournamentMatch.winner).load_only(*PLAYER_LABEL_COLUMNS), # Set once a match is decided
+)
+
 @app.route('/')
+@cache.cached(key_prefix=index_cache_key)
 def index():
-    all_players = Player.query.order_by(Player.elo.desc()).all()
-    
-    # Separate players into active (W+L > 0) and inactive (W+L = 0)
-    active_players = [p for p in all_players if p.wins + p.losses > 0]
-    inactive_players = [p for p in all_players if p.wins + p.losses == 0]
-
-    matches = Match.query.options(
-        joinedload(Match.winner), 
-        joinedload(Match.loser)
-    ).order_by(Match.date.desc()).limit(10).all()
+    # Players split into active (W+L > 0) and inactive (W+L = 0) by the database
+    active_players, inactive_players = get_leaderboard()
+
+    matches = get_recent_matches()
     
-    config = LeagueConfig.query.get(1)
-    admin_note = config.admin_note if config else ""
-    tournament_state = config.tournament_state if config else 0
+    config = get_config()
+    admin_note = config['admin_note']
+    tournament_state = config['tournament_state']
     
     current_tournament = None
     signed_up_players = []
@@ -200,17 +601,17 @@ def index():
     max_round_num = 0 # Track the current/max round number
     
     if tournament_state == 1: # Signup Active
-        current_tournament = Tournament.query.order_by(Tournament.id.desc()).first()
-        signed_up_players = [s.player for s in TournamentSignup.query.options(joinedload(TournamentSignup.player)).all()]
+        current_tournament = Tournament.query.options(*guard_lazy_loads()).order_by(Tournament.id.desc()).first()
+        signed_up_players = [s.player for s in TournamentSignup.query.options(
+            *guard_lazy_loads(joinedload(TournamentSignup.player).load_only(*PLAYER_LABEL_COLUMNS))
+        ).all()]
         
     elif tournament_state == 2: # Tournament Active
-        current_tournament = Tournament.query.order_by(Tournament.id.desc()).first()
+        current_tournament = Tournament.query.options(*guard_lazy_loads()).order_by(Tournament.id.desc()).first()
         if current_tournament:
             # Load ALL matches for the current tournament, ordered by round and match number
             current_matches = TournamentMatch.query.options(
-                joinedload(TournamentMatch.player1), 
-                joinedload(TournamentMatch.player2),
-                joinedload(TournamentMatch.winner) # Load the winner for completed matches
+                *guard_lazy_loads(*BRACKET_PLAYER_LOADS)
             ).filter(
                 TournamentMatch.tournament_id == current_tournament.id
             ).order_by(TournamentMatch.round_num, TournamentMatch.match_num).all()
@@ -221,14 +622,14 @@ def index():
             
     elif tournament_state == 3: # Tournament Concluded
         # Get the last concluded tournament and load its winner
-        concluded_tournament = Tournament.query.options(joinedload(Tournament.winner)).order_by(Tournament.id.desc()).first()
+        concluded_tournament = Tournament.query.options(
+            *guard_lazy_loads(joinedload(Tournament.winner).load_only(*PLAYER_LABEL_COLUMNS))
+        ).order_by(Tournament.id.desc()).first()
 
         # Fetch all matches for the concluded tournament
         if concluded_tournament:
             current_matches = TournamentMatch.query.options(
-                joinedload(TournamentMatch.player1), 
-                joinedload(TournamentMatch.player2),
-                joinedload(TournamentMatch.winner) 
+                *guard_lazy_loads(*BRACKET_PLAYER_LOADS)
             ).filter(
                 TournamentMatch.tournament_id == concluded_tournament.id
             ).order_by(TournamentMatch.round_num, TournamentMatch.match_num).all()
@@ -236,9 +637,6 @@ def index():
             if current_matches:
                  max_round_num = max(m.round_num for m in current_matches)
 
-    def format_date(dt_object):
-        return dt_object.strftime('%b %d, %H:%M')
-
     return render_template('index.html', 
                            players=active_players, # PASSING active_players as 'players' for compatibility
                            inactive_players=inactive_players, # NEW: Passing inactive list
@@ -248,8 +646,7 @@ def index():
                            signed_up_players=signed_up_players,
                            all_tournament_matches=current_matches, # Changed variable name
                            max_round_num=max_round_num,           # New variable
-                           concluded_tournament=concluded_tournament,
-                           format_date=format_date)
+                           concluded_tournament=concluded_tournament)
 
 @app.route('/add_player', methods=['POST'])
 def add_player():
@@ -258,11 +655,11 @@ def add_player():
         new_player = Player(name=name)
         db.session.add(new_player)
         db.session.commit()
+        bump_league_version()
     return redirect('/')
 
 @app.route('/log_match', methods=['POST'])
 def log_match():
-    # ... (log_match logic remains the same) ...
     winner_id = int(request.form['winner'])
     loser_id = int(request.form['loser'])
     score = request.form['score']
@@ -270,34 +667,47 @@ def log_match():
     if winner_id == loser_id:
         return redirect('/') 
 
-    winner = db.session.get(Player, winner_id)
-    loser = db.session.get(Player, loser_id)
+    # Three statements, no ORM objects: lock and read both players, update both
+    # with one UPDATE, insert the match. The row locks (FOR UPDATE; a no-op on
+    # SQLite) stop a concurrent match for the same player from rating off stale Elo.
+    players = {row.id: row for row in db.session.execute(
+        select(Player.id, Player.elo)
+        .where(Player.id.in_([winner_id, loser_id]))
+        .with_for_update()
+    )}
     
-    if not winner or not loser:
+    if winner_id not in players or loser_id not in players:
         return "One or both players not found.", 404
         
-    winner_pre_elo = winner.elo
-    loser_pre_elo = loser.elo
+    winner_pre_elo = players[winner_id].elo
+    loser_pre_elo = players[loser_id].elo
     
     winner_post_elo, loser_post_elo = calculate_elo(winner_pre_elo, loser_pre_elo)
     
-    winner.elo = winner_post_elo
-    winner.wins += 1
-    loser.elo = loser_post_elo
-    loser.losses += 1
-    
-    new_match = Match(
+    is_winner = Player.id == winner_id
+    db.session.execute(
+        update(Player)
+        .where(Player.id.in_([winner_id, loser_id]))
+        .values(
+            elo=case((is_winner, winner_post_elo), else_=loser_post_elo),
+            wins=case((is_winner, Player.wins + 1), else_=Player.wins),
+            losses=case((is_winner, Player.losses), else_=Player.losses + 1),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(insert(Match).values(
         winner_id=winner_id,
         loser_id=loser_id,
         score=score,
+        date=datetime.utcnow(),
         winner_pre_elo=winner_pre_elo,
         loser_pre_elo=loser_pre_elo,
         winner_post_elo=winner_post_elo,
         loser_post_elo=loser_post_elo
-    )
-    db.session.add(new_match)
+    ))
     
     db.session.commit()
+    bump_league_version()
     return redirect('/')
 
 # --- ADMIN FEATURES ---
@@ -311,54 +721,103 @@ def check_admin_password_route():
     else:
         return {"success": False, "message": "Incorrect Password"}, 401 
 
+class AdminPasswordCheckMiddleware:
+    """
+    WSGI middleware that answers JSON POSTs to /check_admin_password itself,
+    without entering Flask (no request context, session setup or hooks).
+    Anything it can't handle, e.g. a malformed body, is passed on to the
+    check_admin_password_route view above.
+    """
+    PATH = '/check_admin_password'
+    SUCCESS_BODY = orjson.dumps({"success": True})
+    FAILURE_BODY = orjson.dumps({"success": False, "message": "Incorrect Password"})
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if (environ.get('PATH_INFO') != self.PATH
+                or environ.get('REQUEST_METHOD') != 'POST'
+                or not environ.get('CONTENT_TYPE', '').startswith('application/json')):
+            return self.wsgi_app(environ, start_response)
+
+        # Only bodies with a declared length; chunked ones (no CONTENT_LENGTH)
+        # go to Flask untouched, which knows how to read them
+        try:
+            length = int(environ.get('CONTENT_LENGTH', ''))
+        except ValueError:
+            return self.wsgi_app(environ, start_response)
+        if length < 0:
+            return self.wsgi_app(environ, start_response)
+        body = environ['wsgi.input'].read(length)
+        try:
+            submitted_password = orjson.loads(body).get('admin_password')
+        except (ValueError, AttributeError):
+            # Let Flask produce its usual error response from the same body
+            environ['wsgi.input'] = io.BytesIO(body)
+            return self.wsgi_app(environ, start_response)
+
+        if check_admin_password(submitted_password):
+            status, payload = '200 OK', self.SUCCESS_BODY
+        else:
+            status, payload = '401 UNAUTHORIZED', self.FAILURE_BODY
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+app.wsgi_app = AdminPasswordCheckMiddleware(app.wsgi_app)
+
 @app.route('/remove_player/<int:player_id>', methods=['POST'])
 def remove_player(player_id):
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-    player = db.session.get(Player, player_id)
-    if player:
-        Match.query.filter((Match.winner_id == player_id) | (Match.loser_id == player_id)).delete(synchronize_session='fetch')
-        db.session.delete(player)
-        db.session.commit()
+    # Plain DELETEs in one transaction: the player's matches first (they reference
+    # the player), then the player. Nothing is loaded into the session.
+    db.session.execute(
+        delete(Match)
+        .where(or_(Match.winner_id == player_id, Match.loser_id == player_id))
+        .execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(
+        delete(Player).where(Player.id == player_id).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        bump_league_version()
     return redirect('/')
 
 @app.route('/remove_match/<int:match_id>', methods=['POST'])
 def remove_match(match_id):
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-    match = db.session.get(Match, match_id)
-    if match:
-        winner_elo_change = match.winner_post_elo - match.winner_pre_elo
-        loser_elo_change = match.loser_post_elo - match.loser_pre_elo
-        winner = db.session.get(Player, match.winner_id)
-        loser = db.session.get(Player, match.loser_id)
-        if winner and loser:
-            winner.elo -= winner_elo_change
-            winner.wins -= 1
-            loser.elo -= loser_elo_change
-            loser.losses -= 1
-        db.session.delete(match)
+    result = db.session.execute(delete(Match).where(Match.id == match_id))
+    if result.rowcount:
+        # Every later match was rated off the removed one, so rebuild the chain
+        replay_elos()
         db.session.commit()
+        bump_league_version()
     return redirect('/')
     
+@app.route('/admin_recompute_elos', methods=['POST'])
+def admin_recompute_elos():
+    """Rebuilds every rating and the Elo history of every match from the match log."""
+    replay_elos()
+    db.session.commit()
+    bump_league_version()
+    return redirect('/')
+
 @app.route('/update_admin_note', methods=['POST'])
 def update_admin_note():
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
     new_note = request.form.get('admin_note', '').strip()
     config = db.session.get(LeagueConfig, 1)
     if config:
         config.admin_note = new_note
         db.session.commit()
+        bump_league_version()
     return redirect('/')
 
 # --- NEW TOURNAMENT ROUTES ---
 
 @app.route('/admin_start_signup', methods=['POST'])
 def admin_start_signup():
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-    
     config = db.session.get(LeagueConfig, 1)
     if config.tournament_state == 0 or config.tournament_state == 3:
         # Clear old signups and create a new Tournament entry
@@ -372,13 +831,11 @@ def admin_start_signup():
         db.session.add(new_tournament)
         config.tournament_state = 1 # Set to Signup Active
         db.session.commit()
+        bump_league_version()
     return redirect('/')
 
 @app.route('/admin_start_tournament', methods=['POST'])
 def admin_start_tournament():
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-        
     config = db.session.get(LeagueConfig, 1)
     if config.tournament_state != 1:
         return "Signup is not currently active.", 400
@@ -395,30 +852,26 @@ def admin_start_tournament():
     initial_matches = generate_bracket(signed_up_players)
     
     for match in initial_matches:
-        match.tournament_id = current_tournament.id
-        db.session.add(match)
+        match['tournament_id'] = current_tournament.id
+    db.session.execute(insert(TournamentMatch), initial_matches)
 
     config.tournament_state = 2 # Set to Tournament Active
     db.session.commit()
+    bump_league_version()
     return redirect('/')
     
 @app.route('/admin_end_tournament', methods=['POST'])
 def admin_end_tournament():
     # In a real app, this is where you'd calculate final rankings.
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-    
     config = db.session.get(LeagueConfig, 1)
     config.tournament_state = 0 # Concluded
     db.session.commit()
+    bump_league_version()
     return redirect('/')
 
 @app.route('/admin_start_next_round', methods=['POST'])
 def admin_start_next_round():
     """Processes winners of the current round and generates matches for the next round."""
-    if not check_admin_password(request.form.get('admin_password')):
-        return "Unauthorized: Incorrect admin password.", 401
-    
     config = db.session.get(LeagueConfig, 1)
     if config.tournament_state != 2:
         return "Tournament is not currently active.", 400
@@ -427,36 +880,32 @@ def admin_start_next_round():
     if not current_tournament:
         return "No active tournament found.", 404
         
-    # 1. Find the current highest round number in the tournament
-    current_round = db.session.query(db.func.max(TournamentMatch.round_num)).filter(
+    # 1. Load the results of the current (highest) round in one query
+    latest_round = select(func.max(TournamentMatch.round_num)).where(
         TournamentMatch.tournament_id == current_tournament.id
-    ).scalar()
+    ).scalar_subquery()
+    current_round_matches = db.session.execute(
+        select(TournamentMatch.round_num, TournamentMatch.winner_id, TournamentMatch.player2_id)
+        .where(
+            TournamentMatch.tournament_id == current_tournament.id,
+            TournamentMatch.round_num == latest_round
+        )
+        .order_by(TournamentMatch.match_num)
+    ).all()
     
-    if current_round is None:
+    if not current_round_matches:
         return "No matches generated for this tournament.", 404
+    current_round = current_round_matches[0].round_num
 
-    # 2. Check if all matches in the current round are completed (excluding those with a BYE)
-    incomplete_matches = TournamentMatch.query.filter(
-        TournamentMatch.tournament_id == current_tournament.id,
-        TournamentMatch.round_num == current_round,
-        TournamentMatch.winner_id == None,
-        TournamentMatch.player2_id != None # Exclude BYE matches which are auto-completed
-    ).all()
-
-    if incomplete_matches:
+    # 2. Check if all matches in the current round are completed (BYE matches are auto-completed)
+    if any(m.winner_id is None and m.player2_id is not None for m in current_round_matches):
         # If matches are incomplete, do not advance the round
         return redirect(url_for('index')) 
 
-    # 3. All matches are complete. Find the winners of the current round.
-    current_round_winners = TournamentMatch.query.filter(
-        TournamentMatch.tournament_id == current_tournament.id,
-        TournamentMatch.round_num == current_round,
-        TournamentMatch.winner_id != None # Only completed matches (including BYEs)
-    ).order_by(TournamentMatch.match_num).all()
+    # 3. All matches are complete. Collect the winners of the current round (including BYEs).
+    winners_ids = [m.winner_id for m in current_round_matches if m.winner_id is not None]
     
     # 4. Check for tournament winner (Only one winner remains)
-    winners_ids = [match.winner_id for match in current_round_winners]
-    
     if len(winners_ids) <= 1:
         # The single winner is the champion
         winner_id = winners_ids[0] if winners_ids else None
@@ -465,6 +914,7 @@ def admin_start_next_round():
         current_tournament.end_date = date.today()
         config.tournament_state = 3 # Concluded
         db.session.commit()
+        bump_league_version()
         return redirect('/')
 
     # 5. Generate the next round's matches
@@ -478,6 +928,7 @@ def admin_start_next_round():
     # Check if there is an odd number of winners. If so, the last winner gets a bye.
     last_winner_gets_bye = (len(winners_ids) % 2 != 0)
     
+    next_round_matches = []
     for i in range(num_matches):
         p1_id = winners_ids[i * 2]
         p2_id = winners_ids[i * 2 + 1]
@@ -486,21 +937,22 @@ def admin_start_next_round():
         is_final_round = (num_matches + (1 if last_winner_gets_bye else 0) == 1) and next_round > 1
         best_of = 5 if is_final_round else 3
         
-        new_match = TournamentMatch(
+        next_round_matches.append(dict(
             tournament_id=current_tournament.id,
             round_num=next_round,
             match_num=i + 1,
             player1_id=p1_id,
             player2_id=p2_id,
+            winner_id=None,
+            score=None,
             best_of_games=best_of
-        )
-        db.session.add(new_match)
+        ))
 
     # Handle a potential mid-tournament bye if the number of winners is odd
     if last_winner_gets_bye:
         bye_player_id = winners_ids[-1]
         
-        new_match = TournamentMatch(
+        next_round_matches.append(dict(
             tournament_id=current_tournament.id,
             round_num=next_round,
             match_num=num_matches + 1,
@@ -509,11 +961,12 @@ def admin_start_next_round():
             winner_id=bye_player_id,
             score="BYE",
             best_of_games=3 
-        )
-        db.session.add(new_match)
-
+        ))
 
+    # Insert the whole round as one executemany INSERT
+    db.session.execute(insert(TournamentMatch), next_round_matches)
     db.session.commit()
+    bump_league_version()
     return redirect('/')
 
 @app.route('/signup_for_tournament', methods=['POST'])
@@ -526,6 +979,8 @@ def signup_for_tournament():
     except:
         return "Invalid player ID submitted.", 400
 
+    # Read from the database, not the get_config() snapshot, so a signup can't
+    # slip in after the bracket has been generated
     config = db.session.get(LeagueConfig, 1)
     if config.tournament_state != 1:
         return "Signup is not currently active.", 400
@@ -538,6 +993,7 @@ def signup_for_tournament():
     new_signup = TournamentSignup(player_id=player_id)
     db.session.add(new_signup)
     db.session.commit()
+    bump_league_version()
     return redirect('/')
 
 # --- Tournament Match Logging (Simplified) ---
@@ -571,6 +1027,7 @@ def log_tournament_match(tmatch_id):
     # Logic for generating the next round is now in admin_start_next_round
     
     db.session.commit()
+    bump_league_version()
     return redirect('/')
 
 
@@ -578,12 +1035,52 @@ def init_db():
     """Initializes the database structure and ensures a LeagueConfig entry exists."""
     with app.app_context():
         db.create_all()
-        # Ensure the LeagueConfig row exists for the admin note
-        if LeagueConfig.query.get(1) is None:
+        # Databases created before players.matches_played existed need the column
+        # added. SQLite can only add generated columns as VIRTUAL.
+        player_columns = {c['name'] for c in inspect(db.engine).get_columns('players')}
+        if 'matches_played' not in player_columns:
+            if db.engine.dialect.name == 'sqlite':
+                add_column = "ADD COLUMN matches_played INTEGER GENERATED ALWAYS AS (wins + losses) VIRTUAL"
+            else:
+                add_column = "ADD COLUMN IF NOT EXISTS matches_played INTEGER GENERATED ALWAYS AS (wins + losses) STORED"
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE players {add_column}"))
+            except OperationalError as e:
+                # SQLite has no ADD COLUMN IF NOT EXISTS; another init_db run may
+                # have added it since the check above.
+                if 'duplicate column name' not in str(e.orig):
+                    raise
+            with db.engine.begin() as connection:
+                # Superseded by ix_players_mp_elo
+                connection.execute(text("DROP INDEX IF EXISTS ix_players_matches_played"))
+        # create_all() skips tables that already exist, so add any indexes
+        # introduced since the database was first created. IF NOT EXISTS rather
+        # than checkfirst, since expression indexes can't be reflected.
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+        # Ensure the LeagueConfig row exists for the admin note. On PostgreSQL and
+        # SQLite this is a single idempotent upsert.
+        dialect_insert = {'postgresql': pg_insert, 'sqlite': sqlite_insert}.get(db.engine.dialect.name)
+        if dialect_insert is not None:
+            db.session.execute(
+                dialect_insert(LeagueConfig)
+                .values(id=1, admin_note="", tournament_state=0)
+                .on_conflict_do_nothing(index_elements=['id'])
+            )
+            db.session.commit()
+        elif db.session.get(LeagueConfig, 1) is None:
             config = LeagueConfig(id=1, admin_note="", tournament_state=0)
             db.session.add(config)
             db.session.commit()
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Creates or upgrades the schema. Run once per deploy, before starting the workers."""
+    init_db()
+
 if __name__ == '__main__':
     init_db()
-    app.run(host='0.0.0.0', port=80, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 80)), debug=DEBUG)
\ No newline at end of file
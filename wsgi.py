@@ -0,0 +1,26 @@
+"""
+Production entrypoint. Create or upgrade the schema once per deploy, then start
+the workers:
+
+    flask --app app init-db
+    gunicorn -k gevent -w 2 --worker-connections 1000 wsgi:app
+
+Set REDIS_URL to enable caching. The workers share the cache through Redis;
+without it every request reads the database, since a per-worker cache would
+keep serving pages that another worker's write has made stale.
+
+The schema is not touched here: every worker imports this module at the same
+time, and concurrent DDL from several workers can fail and halt the server.
+
+gevent has to patch the standard library before anything else imports it, so
+that database and cache I/O yields to other requests instead of blocking the worker.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+# psycopg2 waits on the socket in C, which monkey.patch_all() can't reach;
+# this makes it yield to the gevent hub as well.
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
+from app import app